@@ -1,36 +1,35 @@
 import os
-from collections import defaultdict
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from scipy import stats
-import statsmodels.api as sm
-from taq.MyDirectories import MyDirectories, BASE_PATH
-from taq.DataProcessor import DataProcessor
-from taq.TAQQuotesReader import TAQQuotesReader
-from taq.NLSEstimator import NLSImpactEstimator
-from taq.Utils import extract_tar_files, extract_all_quotes, get_stock_list  # Importing from Utils
-
-def main():
+import argparse
+from taq.MyDirectories import MyDirectories
+
+# Heavy libraries (pandas, numpy, scipy, statsmodels, matplotlib) are imported inside
+# the subcommands that need them so that short jobs start quickly.
+
+FEATURE_NAMES = ["2min_returns", "total_volume", "arrival_price", "imbalance", "terminal_price"]
+
+def run_extract(args, state):
     # Extract quote and trade data from tar files
+    from taq.Utils import extract_tar_files
+
     quotes_extract_dir = MyDirectories.getQuotesDir()
     quotes_tar_dir = os.path.join(quotes_extract_dir, "..")
     extract_tar_files(quotes_tar_dir, quotes_extract_dir)
 
-    trades_extract_dir = MyDirectories.getQuotesDir()
+    trades_extract_dir = MyDirectories.getTradesDir()
     trades_tar_dir = os.path.join(trades_extract_dir, "..")
     extract_tar_files(trades_tar_dir, trades_extract_dir)
 
-    # Initialize data processor
-    processor = DataProcessor(quotes_extract_dir)
+def run_features(args, state):
+    # Build the feature matrices from the extracted quotes and save them to CSV
+    from collections import defaultdict
+    import pandas as pd
+    from taq.DataProcessor import DataProcessor
+    from taq.TAQQuotesReader import TAQQuotesReader
+    from taq.Utils import extract_all_quotes, get_stock_list
 
-    feature_matrices = {
-        "2min_returns": defaultdict(dict),
-        "total_volume": defaultdict(dict),
-        "arrival_price": defaultdict(dict),
-        "imbalance": defaultdict(dict),
-        "terminal_price": defaultdict(dict),
-    }
+    quotes_extract_dir = MyDirectories.getQuotesDir()
+    processor = DataProcessor(quotes_extract_dir)
+    feature_matrices = {name: defaultdict(dict) for name in FEATURE_NAMES}
 
     # Process each extracted date folder
     for date_folder in sorted(os.listdir(quotes_extract_dir)):
@@ -49,52 +48,61 @@ def main():
 
             processor.add_midquote_to_data(daily_data)
 
-            # Compute required metrics
-            two_minute_returns = processor.compute_midquote_returns(daily_data)
-            total_volume = processor.compute_total_daily_volume(daily_data)
-            arrival_price = processor.compute_arrival_price(daily_data)
-            imbalance = processor.compute_imbalance(daily_data)
-            terminal_price = processor.compute_terminal_price(daily_data)
-
-            # Populate feature matrices
-            feature_matrices["2min_returns"][stock][date_folder] = two_minute_returns
-            feature_matrices["total_volume"][stock][date_folder] = total_volume
-            feature_matrices["arrival_price"][stock][date_folder] = arrival_price
-            feature_matrices["imbalance"][stock][date_folder] = imbalance
-            feature_matrices["terminal_price"][stock][date_folder] = terminal_price
+            # Compute required metrics and populate feature matrices
+            feature_matrices["2min_returns"][stock][date_folder] = processor.compute_midquote_returns(daily_data)
+            feature_matrices["total_volume"][stock][date_folder] = processor.compute_total_daily_volume(daily_data)
+            feature_matrices["arrival_price"][stock][date_folder] = processor.compute_arrival_price(daily_data)
+            feature_matrices["imbalance"][stock][date_folder] = processor.compute_imbalance(daily_data)
+            feature_matrices["terminal_price"][stock][date_folder] = processor.compute_terminal_price(daily_data)
 
     # Save feature matrices to CSV
-    feature_dir = os.path.join(BASE_PATH, "../data/feature_matrices")
+    feature_dir = MyDirectories.getFeatureDir()
     os.makedirs(feature_dir, exist_ok=True)
 
     for feature, matrix in feature_matrices.items():
         df = pd.DataFrame(matrix).T.sort_index()
         df.to_csv(os.path.join(feature_dir, f"{feature}.csv"))
 
-    # Initialize the NLSImpactEstimator with the feature directory
-    estimator = NLSImpactEstimator(feature_dir)
+def fit_all(args, state):
+    # Load the stored feature matrices and fit the non-linear impact model on all available
+    # stocks. The result is kept in state so stages running in the same process share it.
+    if "fit" not in state:
+        from taq.NLSEstimator import NLSImpactEstimator
+        from taq.ResultCache import ResultCache
+
+        cache = ResultCache(MyDirectories.getCacheDir(), enabled=not args.no_cache)
+        estimator = NLSImpactEstimator(MyDirectories.getFeatureDir(), cache=cache)
+        stocks = list(estimator.features["total_volume"].index)
+        x_all, y_all = estimator.build_dataset(stocks)
+        eta, beta = estimator.fit_nls(x_all, y_all)
+        state["fit"] = (estimator, x_all, y_all, eta, beta)
+    return state["fit"]
+
+def run_fit(args, state):
+    # Obtain the eta and beta estimates for all stocks
+    _, _, _, eta, beta = fit_all(args, state)
+    print(f"Overall Estimates: eta = {eta}, beta = {beta}")
 
-    # Build dataset using all available stocks
-    stocks = list(estimator.features["total_volume"].index)
-    x_all, y_all = estimator.build_dataset(stocks)
+def run_bootstrap(args, state):
+    # Bootstrap standard errors and write estimates and t-statistics to params_part1.txt
+    import numpy as np
 
-    # Fit the non-linear impact model to obtain eta and beta estimates
-    eta, beta = estimator.fit_nls(x_all, y_all)
-    print(f"Overall Estimates: eta = {eta}, beta = {beta}")
+    estimator, x_all, y_all, eta, beta = fit_all(args, state)
 
     # Bootstrap
-    boot_pairs = estimator.bootstrap_estimates(x_all, y_all, n_iter=1000)
+    boot_pairs = estimator.bootstrap_estimates(x_all, y_all, n_iter=args.n_iter, seed=args.seed)
     eta_se_pairs = np.std(boot_pairs[:, 0])
     beta_se_pairs = np.std(boot_pairs[:, 1])
     t_eta_pairs = eta / eta_se_pairs if eta_se_pairs != 0 else float('nan')
     t_beta_pairs = beta / beta_se_pairs if beta_se_pairs != 0 else float('nan')
 
     # Residual Bootstrap
-    boot_resid = estimator.residual_bootstrap_estimates(x_all, y_all, eta, beta, n_iter=1000)
+    boot_resid = estimator.residual_bootstrap_estimates(x_all, y_all, eta, beta, n_iter=args.n_iter, seed=args.seed + 1)
     eta_se_resid = np.std(boot_resid[:, 0]) if len(boot_resid) > 0 else float('nan')
     beta_se_resid = np.std(boot_resid[:, 1]) if len(boot_resid) > 0 else float('nan')
     t_eta_resid = eta / eta_se_resid if eta_se_resid != 0 else float('nan')
     t_beta_resid = beta / beta_se_resid if beta_se_resid != 0 else float('nan')
+    print(f"Residual bootstrap t-statistics: t-eta = {t_eta_resid}, t-beta = {t_beta_resid}")
 
     # Write parameter estimates and t-statistics (from pairs bootstrap) to params_part1.txt
     with open("params_part1.txt", "w") as f:
@@ -104,9 +112,33 @@ def main():
         f.write(f"t-beta = {t_beta_pairs}\n")
     print("Parameter estimates and t-values (pairs bootstrap) written to params_part1.txt")
 
+def run_diagnostics(args, state):
+    # Residual normality, activity groups and heteroskedasticity tests
+    from scipy import stats
+
+    estimator, x_all, y_all, eta, beta = fit_all(args, state)
+    residuals = y_all - estimator.impact_model(x_all, eta, beta)
+
+    # Shapiro-Wilk test for normality
+    shapiro_stat, shapiro_p = stats.shapiro(residuals)
+    print(f"Shapiro-Wilk test statistic: {shapiro_stat}, p-value: {shapiro_p}")
+
+    # Compare Parameters for High vs. Low Activity Stocks
+    estimator.compare_stock_groups()
+
+    # Extra Credit: White's Test for Heteroskedasticity
+    estimator.test_heteroskedasticity(x_all, y_all, eta, beta)
+
+def run_plots(args, state):
     # Residual Analysis (Almgren et al.)
-    y_hat = estimator.impact_model(x_all, eta, beta)
-    residuals = y_all - y_hat
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import statsmodels.api as sm
+
+    estimator, x_all, y_all, eta, beta = fit_all(args, state)
+    residuals = y_all - estimator.impact_model(x_all, eta, beta)
 
     # Histogram of residuals
     plt.figure()
@@ -132,15 +164,42 @@ def main():
     plt.savefig("nls_log_qq_plot.png")
     plt.close()
 
-    # Shapiro-Wilk test for normality
-    shapiro_stat, shapiro_p = stats.shapiro(residuals)
-    print(f"Shapiro-Wilk test statistic: {shapiro_stat}, p-value: {shapiro_p}")
-
-    # Compare Parameters for High vs. Low Activity Stocks
-    estimator.compare_stock_groups()
-
-    # Extra Credit: White's Test for Heteroskedasticity
-    estimator.test_heteroskedasticity(x_all, y_all)
+STAGES = {
+    "extract": run_extract,
+    "features": run_features,
+    "fit": run_fit,
+    "bootstrap": run_bootstrap,
+    "plots": run_plots,
+    "diagnostics": run_diagnostics,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the TAQ pipeline, or one of its stages")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every estimate without the on-disk cache")
+    parser.add_argument("--clear-cache", action="store_true", help="invalidate all cached estimates before running")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the bootstrap resampling")
+    parser.add_argument("--n-iter", type=int, default=1000, help="number of bootstrap iterations")
+    subparsers = parser.add_subparsers(dest="command", metavar="command",
+                                       help="stage to run (default: all stages in order)")
+    subparsers.add_parser("extract", help="extract quote and trade tar files")
+    subparsers.add_parser("features", help="build feature matrices from extracted quotes")
+    subparsers.add_parser("fit", help="fit the impact model on the stored feature matrices")
+    subparsers.add_parser("bootstrap", help="bootstrap t-statistics and write params_part1.txt")
+    subparsers.add_parser("diagnostics", help="Shapiro-Wilk, activity group and White's tests")
+    subparsers.add_parser("plots", help="residual histogram and Q-Q plots")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.clear_cache:
+        from taq.ResultCache import ResultCache
+        ResultCache(MyDirectories.getCacheDir()).invalidate()
+
+    # Stages run in one process share the loaded features and full-sample fit through state
+    state = {}
+    commands = [args.command] if args.command else list(STAGES)
+    for command in commands:
+        STAGES[command](args, state)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
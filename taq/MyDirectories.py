@@ -11,4 +11,14 @@ class MyDirectories:
     @staticmethod
     def getTradesDir():
         """Returns the path to the trades directory."""
-        return os.path.join(BASE_PATH, "../data/trades/extracted")
\ No newline at end of file
+        return os.path.join(BASE_PATH, "../data/trades/extracted")
+    
+    @staticmethod
+    def getFeatureDir():
+        """Returns the path to the feature matrices directory."""
+        return os.path.join(BASE_PATH, "../data/feature_matrices")
+    
+    @staticmethod
+    def getCacheDir():
+        """Returns the path to the on-disk cache of estimation results."""
+        return os.path.join(BASE_PATH, "../data/cache")
\ No newline at end of file
@@ -1,17 +1,33 @@
 import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from scipy.optimize import curve_fit
-from statsmodels.stats.diagnostic import het_white
-import statsmodels.api as sm
+
+# Columns of the tidy table returned by NLSImpactEstimator.fit_groups
+GROUP_RESULT_COLUMNS = [
+    "group", "n_obs", "eta", "beta",
+    "eta_se_pairs", "beta_se_pairs", "t_eta_pairs", "t_beta_pairs",
+    "eta_se_resid", "beta_se_resid", "t_eta_resid", "t_beta_resid",
+]
 
 # Class to estimate the impact of imbalances on stock prices using Nonlinear Least Squares (NLS)
 class NLSImpactEstimator:
-    def __init__(self, feature_dir):
-        # Initialize the estimator with the directory containing feature data
+    # Initial guess for (eta, beta) passed to curve_fit. Cache keys include p0 and a hash of
+    # the code of impact_model and _curve_fit, so editing either invalidates cached estimates;
+    # bump model_version when a change elsewhere (e.g. a helper they call) alters the results.
+    p0 = (0.01, 0.5)
+    model_version = 1
+
+    def __init__(self, feature_dir, cache=None):
+        # Initialize the estimator with the directory containing feature data and an
+        # optional ResultCache; without a cache every estimate is recomputed
         self.feature_dir = feature_dir
+        self.cache = cache
         self.features = {}
-        self._load_features()
+        if feature_dir is not None:
+            self._load_features()
 
     def _load_features(self):
         # Load feature data from CSV files into a dictionary
@@ -59,70 +75,255 @@ class NLSImpactEstimator:
                     continue
         return np.array(x_vals), np.array(y_vals)
 
+    def _impact_matrices(self):
+        # Compute absolute imbalance (qv) and absolute price impact for every stock/date in one pass
+        imbalances = self.features["imbalance"].apply(pd.to_numeric, errors="coerce")
+        arrivals = self.features["arrival_price"].reindex(index=imbalances.index, columns=imbalances.columns)
+        terminals = self.features["terminal_price"].reindex(index=imbalances.index, columns=imbalances.columns)
+        qv = np.abs(imbalances.to_numpy(dtype=float))
+        impact = np.abs(terminals.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+                        - arrivals.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float))
+        valid = ~(np.isnan(qv) | np.isnan(impact))
+        return imbalances.index, imbalances.columns, qv, impact, valid
+
+    def _group_masks(self, groups, stocks, dates):
+        # Turn a grouping into one boolean stock x date mask per group label.
+        # A dict maps labels to lists of stocks, a Series maps stocks to labels and a
+        # DataFrame (stocks x dates, like the feature matrices) maps each stock/date to a label.
+        if isinstance(groups, dict):
+            return {label: np.broadcast_to(stocks.isin(list(members))[:, None], (len(stocks), len(dates)))
+                    for label, members in groups.items()}
+        if isinstance(groups, pd.Series):
+            labels = np.repeat(groups.reindex(stocks).to_numpy(dtype=object)[:, None], len(dates), axis=1)
+        elif isinstance(groups, pd.DataFrame):
+            labels = groups.reindex(index=stocks, columns=dates).to_numpy(dtype=object)
+        else:
+            raise TypeError("groups must be a dict, pandas Series or pandas DataFrame")
+        # Take the labels from the grouping itself: reindexing can insert NaN for stocks or dates
+        # it does not cover, which would turn integer labels into floats
+        unique_labels = [label for label in pd.unique(groups.to_numpy().ravel()) if not pd.isna(label)]
+        try:
+            unique_labels = sorted(unique_labels)
+        except TypeError:
+            # Mixed label types keep their order of appearance
+            pass
+        masks = {label: labels == label for label in unique_labels}
+        return {label: mask for label, mask in masks.items() if mask.any()}
+
+    def build_group_datasets(self, groups):
+        # Build the (x, y) dataset of every group from a single vectorized pass over the features
+        stocks, dates, qv, impact, valid = self._impact_matrices()
+        datasets = {}
+        for label, mask in self._group_masks(groups, stocks, dates).items():
+            selected = valid & mask
+            datasets[label] = (qv[selected], impact[selected])
+        return datasets
+
+    def volume_groups(self, n_buckets=10):
+        # Assign each stock to a volume bucket (0 = lowest average volume)
+        avg_vol = self.get_avg_volume_by_stock().dropna()
+        return pd.qcut(avg_vol.rank(method="first"), n_buckets, labels=False).astype(int)
+
+    def volatility_groups(self, n_buckets=10):
+        # Assign each stock to a volatility bucket (0 = lowest) using the standard
+        # deviation of its daily arrival-to-terminal returns
+        arrivals = self.features["arrival_price"]
+        terminals = self.features["terminal_price"].reindex(index=arrivals.index, columns=arrivals.columns)
+        daily_vol = (terminals / arrivals - 1).std(axis=1).dropna()
+        return pd.qcut(daily_vol.rank(method="first"), n_buckets, labels=False).astype(int)
+
+    def date_window_groups(self, n_windows):
+        # Split the sorted trading dates into consecutive windows labelled "first_date:last_date"
+        df = self.features["imbalance"]
+        dates = sorted(df.columns)
+        labels = pd.Series(index=dates, dtype=object)
+        for window in np.array_split(np.array(dates, dtype=object), n_windows):
+            if len(window) > 0:
+                labels[list(window)] = f"{window[0]}:{window[-1]}"
+        return pd.DataFrame([labels.reindex(df.columns).to_numpy()] * len(df.index),
+                            index=df.index, columns=df.columns)
+
     def impact_model(self, x, eta, beta):
         # Define the nonlinear impact model: impact = eta * imbalance^beta
         return eta * x**beta
 
-    def fit_nls(self, x, y):
+    def _cached(self, kind, compute, arrays, code=(), **settings):
+        # Look the result up in the cache, keyed on the input arrays, model, solver settings,
+        # the code of any extra functions computing the result and any extra settings
+        # (seed, n_iter, ...); compute and store it on a miss
+        if self.cache is None:
+            return compute()
+        model = f"{type(self).__module__}.{type(self).__qualname__}.impact_model"
+        model_code = _code_fingerprint(self.impact_model, self._curve_fit, *code)
+        key = self.cache.make_key(kind, *arrays, model=model, model_code=model_code,
+                                  model_version=self.model_version, p0=self.p0, **settings)
+        return self.cache.get_or_compute(key, compute)
+
+    def _curve_fit(self, x, y):
         # Fit the nonlinear impact model to the data using curve fitting
-        return curve_fit(self.impact_model, x, y, p0=(0.01, 0.5))[0]
+        return curve_fit(self.impact_model, x, y, p0=self.p0)[0]
+
+    def fit_nls(self, x, y):
+        # Fit the nonlinear impact model to the data, reusing a cached fit when available
+        return self._cached("fit_nls", lambda: self._curve_fit(x, y), (x, y))
 
-    def bootstrap_estimates(self, x, y, n_iter=1000):
-        # Perform bootstrap resampling to estimate model parameters
+    def bootstrap_estimates(self, x, y, n_iter=1000, seed=None, use_cache=True):
+        # Perform bootstrap resampling to estimate model parameters.
+        # Results are only cached when a seed makes them reproducible and use_cache is set.
+        if seed is None:
+            return self._bootstrap_estimates(x, y, n_iter, np.random)
+        if not use_cache:
+            return self._bootstrap_estimates(x, y, n_iter, np.random.RandomState(seed))
+        return self._cached("bootstrap_estimates",
+                            lambda: self._bootstrap_estimates(x, y, n_iter, np.random.RandomState(seed)),
+                            (x, y), n_iter=n_iter, seed=seed)
+
+    def _bootstrap_estimates(self, x, y, n_iter, rng):
         estimates = []
         n = len(x)
         for _ in range(n_iter):
-            idx = np.random.choice(n, n, replace=True)
+            idx = rng.choice(n, n, replace=True)
             x_sample, y_sample = x[idx], y[idx]
             try:
-                params = self.fit_nls(x_sample, y_sample)
+                params = self._curve_fit(x_sample, y_sample)
                 estimates.append(params)
             except:
                 # Skip iterations with fitting errors
                 continue
         return np.array(estimates)
     
-    def residual_bootstrap_estimates(self, x, y, eta, beta, n_iter=1000):
-        # Perform residual bootstrap to estimate model parameters
+    def residual_bootstrap_estimates(self, x, y, eta, beta, n_iter=1000, seed=None, use_cache=True):
+        # Perform residual bootstrap to estimate model parameters.
+        # Results are only cached when a seed makes them reproducible and use_cache is set.
+        if seed is None:
+            return self._residual_bootstrap_estimates(x, y, eta, beta, n_iter, np.random)
+        if not use_cache:
+            return self._residual_bootstrap_estimates(x, y, eta, beta, n_iter, np.random.RandomState(seed))
+        return self._cached("residual_bootstrap_estimates",
+                            lambda: self._residual_bootstrap_estimates(x, y, eta, beta, n_iter,
+                                                                       np.random.RandomState(seed)),
+                            (x, y), eta=float(eta), beta=float(beta), n_iter=n_iter, seed=seed)
+
+    def _residual_bootstrap_estimates(self, x, y, eta, beta, n_iter, rng):
         y_hat = self.impact_model(x, eta, beta)
         residuals = y - y_hat
         estimates = []
         n = len(y)
         for _ in range(n_iter):
             # Resample residuals and generate new y values
-            sampled_resid = np.random.choice(residuals, size=n, replace=True)
+            sampled_resid = rng.choice(residuals, size=n, replace=True)
             y_boot = y_hat + sampled_resid
             try:
-                params_boot = self.fit_nls(x, y_boot)
+                params_boot = self._curve_fit(x, y_boot)
                 estimates.append(params_boot)
             except Exception:
                 # Skip iterations with fitting errors
                 continue
         return np.array(estimates)
 
+    def fit_groups(self, groups, n_iter=1000, max_workers=None, seed=None):
+        # Fit the impact model and its pairs/residual bootstraps for every group across a
+        # process pool and return one row per group (see GROUP_RESULT_COLUMNS).
+        # n_iter=0 skips the bootstraps and max_workers=1 runs everything in this process.
+        datasets = self.build_group_datasets(groups)
+        # Every group gets its own random stream. With a seed it is derived from the group's
+        # label, so adding or removing groups leaves the others' estimates (and cache keys)
+        # unchanged. Without a seed each group draws fresh entropy and stays uncached.
+        if seed is None:
+            seed_seqs = np.random.SeedSequence().spawn(len(datasets))
+        else:
+            seed_seqs = [np.random.SeedSequence([seed, _label_entropy(label)]) for label in datasets]
+        use_cache = seed is not None
+        tasks = [(type(self), self.cache, label, x, y, n_iter, seed_seq, use_cache)
+                 for (label, (x, y)), seed_seq in zip(datasets.items(), seed_seqs)]
+        if max_workers == 1 or len(tasks) <= 1:
+            rows = [_fit_group(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                rows = list(pool.map(_fit_group, *zip(*tasks)))
+        return pd.DataFrame(rows, columns=GROUP_RESULT_COLUMNS)
+
     def compare_stock_groups(self):
         # Compare the impact model parameters for high and low activity stock groups
         high, low = self.split_stock_groups()
-        x_high, y_high = self.build_dataset(high)
-        x_low, y_low = self.build_dataset(low)
-        eta_high, beta_high = self.fit_nls(x_high, y_high)
-        eta_low, beta_low = self.fit_nls(x_low, y_low)
-        print("High Activity Stocks: eta =", eta_high, ", beta =", beta_high)
-        print("Low Activity Stocks: eta =", eta_low, ", beta =", beta_low)
-
-    def test_heteroskedasticity(self, x, y):
-        # Test for heteroskedasticity in the residuals using White's test
-        eta, beta = self.fit_nls(x, y)
-        y_hat = self.impact_model(x, eta, beta)
-        residuals = y - y_hat
+        results = self.fit_groups({"High Activity": high, "Low Activity": low}, n_iter=0, max_workers=1)
+        for row in results.itertuples():
+            print(f"{row.group} Stocks: eta = {row.eta} , beta = {row.beta}")
+        return results
 
-        # White's test requires a linear regression model, so we use fitted values as regressor
-        exog = sm.add_constant(y_hat)
-        white_test = het_white(residuals, exog)
+    def test_heteroskedasticity(self, x, y, eta=None, beta=None):
+        # Test for heteroskedasticity in the residuals using White's test.
+        # Pass eta and beta when already estimated to avoid refitting the model.
+        if eta is None or beta is None:
+            eta, beta = self.fit_nls(x, y)
+        white_test = self._cached("test_heteroskedasticity", lambda: self._white_test(x, y, eta, beta), (x, y),
+                                  code=(self._white_test,), eta=float(eta), beta=float(beta))
         labels = ['Test Statistic', 'Test p-value', 'F-Statistic', 'F p-value']
         print("\nWhite's Test for Heteroskedasticity:")
         for label, val in zip(labels, white_test):
             print(f"{label}: {val:.4f}")
+        return white_test
+
+    def _white_test(self, x, y, eta, beta):
+        # statsmodels is slow to import and only needed here
+        from statsmodels.stats.diagnostic import het_white
+        import statsmodels.api as sm
+
+        y_hat = self.impact_model(x, eta, beta)
+        residuals = y - y_hat
+
+        # White's test requires a linear regression model, so we use fitted values as regressor
+        exog = sm.add_constant(y_hat)
+        return np.array(het_white(residuals, exog))
+
+def _code_fingerprint(*funcs):
+    # Hash the bytecode and constants of the given functions (including nested code objects)
+    digest = hashlib.sha256()
+
+    def add_code(code):
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode())
+        for const in code.co_consts:
+            if hasattr(const, "co_code"):
+                add_code(const)
+            else:
+                digest.update(repr(const).encode())
+
+    for func in funcs:
+        add_code(func.__code__)
+    return digest.hexdigest()
+
+def _bootstrap_se(boot, params):
+    # Standard errors and t-statistics of the parameters from bootstrap draws
+    if len(boot) == 0:
+        return [float('nan')] * 4
+    se = np.std(boot, axis=0)
+    t_stats = [p / s if s != 0 else float('nan') for p, s in zip(params, se)]
+    return [se[0], se[1], t_stats[0], t_stats[1]]
+
+def _label_entropy(label):
+    # Stable non-negative integer derived from a group label, used to seed that group
+    return int.from_bytes(hashlib.sha256(str(label).encode()).digest()[:8], "little")
+
+def _fit_group(estimator_cls, cache, label, x, y, n_iter, seed_seq, use_cache):
+    # Process pool task: fit one group and bootstrap its standard errors
+    estimator = estimator_cls(None, cache=cache)
+    row = dict.fromkeys(GROUP_RESULT_COLUMNS, float('nan'))
+    row.update(group=label, n_obs=len(x))
+    try:
+        eta, beta = estimator.fit_nls(x, y)
+    except Exception:
+        # Leave groups that cannot be fitted (e.g. too few observations) as NaN
+        return row
+    row.update(eta=eta, beta=beta)
+    if n_iter > 0:
+        pairs_seed, resid_seed = (int(s) for s in seed_seq.generate_state(2))
+        boot_pairs = estimator.bootstrap_estimates(x, y, n_iter=n_iter, seed=pairs_seed, use_cache=use_cache)
+        boot_resid = estimator.residual_bootstrap_estimates(x, y, eta, beta, n_iter=n_iter, seed=resid_seed,
+                                                            use_cache=use_cache)
+        row.update(zip(GROUP_RESULT_COLUMNS[4:8], _bootstrap_se(boot_pairs, (eta, beta))))
+        row.update(zip(GROUP_RESULT_COLUMNS[8:12], _bootstrap_se(boot_resid, (eta, beta))))
+    return row
 
 if __name__ == "__main__":
     # Main script to initialize the estimator and perform analysis
@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+class ResultCache:
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024, enabled=True):
+        # Initialize the cache with its directory, size bound (in bytes) and on/off switch
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    def make_key(self, kind, *arrays, **settings):
+        """
+        Builds a content-addressed key from the input arrays and the settings
+        that determine the result (model, solver settings, seed, n_iter, ...).
+        The kind prefix lets entries of one kind be invalidated together.
+        """
+        digest = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array.tobytes())
+        digest.update(json.dumps(settings, sort_keys=True, default=lambda o: o.item()).encode())
+        return f"{kind}-{digest.hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        """Returns the cached array for the key, or None on a miss or when disabled."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            result = np.load(path, allow_pickle=False)
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except (OSError, ValueError):
+            # Missing, concurrently evicted or corrupt entries count as misses
+            return None
+        return result
+
+    def put(self, key, result):
+        """Stores the result array under the key, then evicts least recently used entries."""
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.asarray(result), allow_pickle=False)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached result for the key, computing and storing it on a miss."""
+        result = self.get(key)
+        if result is None:
+            result = np.asarray(compute())
+            self.put(key, result)
+        return result
+
+    def _entries(self):
+        # List (mtime, size, path) of every cache entry
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        # Remove least recently used entries until the cache fits in max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def invalidate(self, kind=None):
+        """Removes every cache entry, or only those of the given kind (e.g. "fit_nls")."""
+        removed = 0
+        for _, _, path in self._entries():
+            if kind is None or os.path.basename(path).startswith(f"{kind}-"):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
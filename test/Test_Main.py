@@ -0,0 +1,47 @@
+import os
+import sys
+import subprocess
+import unittest
+from unittest.mock import MagicMock, patch
+import main
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+class TestMain(unittest.TestCase):
+    def test_parse_args_subcommands(self):
+        # Test if every stage is accepted as a subcommand and no subcommand means all stages
+        for command in ["extract", "features", "fit", "bootstrap", "diagnostics", "plots"]:
+            self.assertEqual(main.parse_args([command]).command, command)
+        self.assertIsNone(main.parse_args([]).command)
+
+    def test_parse_args_global_options(self):
+        # Test the defaults and parsing of the global options
+        args = main.parse_args(["fit"])
+        self.assertEqual((args.no_cache, args.clear_cache, args.seed, args.n_iter), (False, False, 0, 1000))
+        args = main.parse_args(["--no-cache", "--clear-cache", "--seed", "3", "--n-iter", "50", "bootstrap"])
+        self.assertEqual((args.no_cache, args.clear_cache, args.seed, args.n_iter), (True, True, 3, 50))
+
+    def test_main_dispatches_chosen_stage(self):
+        # Test if only the chosen stage runs, and all stages run in order without a subcommand
+        stages = {name: MagicMock() for name in main.STAGES}
+        with patch.dict(main.STAGES, stages):
+            main.main(["fit"])
+            self.assertEqual([name for name, stage in stages.items() if stage.called], ["fit"])
+            calls = []
+            for name, stage in stages.items():
+                stage.side_effect = lambda args, state, name=name: calls.append((name, id(state)))
+            main.main([])
+        self.assertEqual([name for name, _ in calls], list(main.STAGES))
+        self.assertEqual(len({state_id for _, state_id in calls}), 1)
+
+    def test_import_is_lightweight(self):
+        # Test if importing main does not pull in the heavy libraries (cold-start time)
+        code = ("import sys, main; "
+                "print(','.join(m for m in ['pandas', 'numpy', 'matplotlib', 'scipy', 'statsmodels'] "
+                "if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+if __name__ == "__main__":
+    unittest.main()
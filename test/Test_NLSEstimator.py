@@ -1,8 +1,12 @@
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
 import pandas as pd
 from unittest.mock import patch
 from taq.NLSEstimator import NLSImpactEstimator
+from taq.ResultCache import ResultCache
 
 class TestNLSImpactEstimator(unittest.TestCase):
     @patch("taq.NLSEstimator.pd.read_csv")
@@ -61,5 +65,128 @@ class TestNLSImpactEstimator(unittest.TestCase):
         res_boot = self.estimator.residual_bootstrap_estimates(x, y, eta, beta, n_iter=10)
         self.assertEqual(res_boot.shape[1], 2)
 
+    def _set_synthetic_features(self):
+        # Replace the mocked features with data that follows the impact model exactly
+        stocks = ['AAPL', 'GOOG', 'MSFT', 'IBM']
+        dates = ['2021-01-0%d' % d for d in range(1, 9)]
+        rng = np.random.default_rng(0)
+        imbalance = pd.DataFrame(rng.uniform(0.1, 2.0, (4, 8)), index=stocks, columns=dates)
+        arrival = pd.DataFrame(100.0, index=stocks, columns=dates)
+        self.estimator.features = {
+            "total_volume": pd.DataFrame(np.arange(32.0).reshape(4, 8), index=stocks, columns=dates),
+            "imbalance": imbalance,
+            "arrival_price": arrival,
+            "terminal_price": arrival + 0.5 * imbalance ** 0.6,
+        }
+
+    def test_build_group_datasets(self):
+        # Test if the grouped datasets match the per-group output of build_dataset
+        self._set_synthetic_features()
+        datasets = self.estimator.build_group_datasets({'first': ['AAPL', 'GOOG'], 'last': ['IBM']})
+        for label, stocks in [('first', ['AAPL', 'GOOG']), ('last', ['IBM'])]:
+            x, y = self.estimator.build_dataset(stocks)
+            np.testing.assert_allclose(datasets[label][0], x)
+            np.testing.assert_allclose(datasets[label][1], y)
+
+    def test_volume_and_date_window_groups(self):
+        # Test if stocks are bucketed by volume and dates are split into windows
+        self._set_synthetic_features()
+        self.assertEqual(self.estimator.volume_groups(2).to_dict(), {'IBM': 1, 'MSFT': 1, 'GOOG': 0, 'AAPL': 0})
+        windows = self.estimator.date_window_groups(2)
+        datasets = self.estimator.build_group_datasets(windows)
+        self.assertEqual(list(datasets), ['2021-01-01:2021-01-04', '2021-01-05:2021-01-08'])
+        self.assertEqual([len(x) for x, _ in datasets.values()], [16, 16])
+
+    def test_volatility_groups(self):
+        # Test if stocks are bucketed by the volatility of their daily returns
+        self._set_synthetic_features()
+        arrival = self.estimator.features["arrival_price"]
+        scale = pd.Series([4.0, 1.0, 3.0, 2.0], index=arrival.index)
+        signs = np.where(np.arange(8) % 2 == 0, 1.0, -1.0)
+        self.estimator.features["terminal_price"] = arrival * (1 + 0.01 * np.outer(scale, signs))
+        self.assertEqual(self.estimator.volatility_groups(2).to_dict(), {'GOOG': 0, 'IBM': 0, 'MSFT': 1, 'AAPL': 1})
+
+    def test_group_labels_keep_dtype_with_missing_stock(self):
+        # Test if stocks without volume do not turn the integer bucket labels into floats
+        self._set_synthetic_features()
+        self.estimator.features["total_volume"].loc['IBM'] = np.nan
+        results = self.estimator.fit_groups(self.estimator.volume_groups(2), n_iter=0, max_workers=1)
+        self.assertEqual(results["group"].tolist(), [0, 1])
+        self.assertTrue(all(isinstance(label, (int, np.integer)) for label in results["group"]))
+
+    def test_fit_groups(self):
+        # Test if the grouped fit returns one row per group with the true parameters
+        self._set_synthetic_features()
+        results = self.estimator.fit_groups(self.estimator.volume_groups(2), n_iter=5, max_workers=2, seed=0)
+        self.assertEqual(results["group"].tolist(), [0, 1])
+        np.testing.assert_allclose(results["eta"], 0.5, rtol=1e-4)
+        np.testing.assert_allclose(results["beta"], 0.6, rtol=1e-4)
+        self.assertFalse(results["eta_se_pairs"].isna().any())
+
+    def test_cached_estimates(self):
+        # Test if fits and seeded bootstraps are reused from the cache instead of recomputed
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.estimator.cache = ResultCache(cache_dir)
+        x = np.array([1, 2, 3, 4, 5], dtype=float)
+        y = 0.5 * x ** 0.6
+        params = self.estimator.fit_nls(x, y)
+        boot = self.estimator.bootstrap_estimates(x, y, n_iter=5, seed=1)
+        with patch("taq.NLSEstimator.curve_fit", side_effect=AssertionError("recomputed")):
+            np.testing.assert_array_equal(self.estimator.fit_nls(x, y), params)
+            np.testing.assert_array_equal(self.estimator.bootstrap_estimates(x, y, n_iter=5, seed=1), boot)
+        self.assertEqual(self.estimator.cache.invalidate("fit_nls"), 1)
+
+    def test_cache_key_tracks_model_code(self):
+        # Test if editing the impact model invalidates cached fits
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.estimator.cache = ResultCache(cache_dir)
+        x = np.array([1, 2, 3, 4, 5], dtype=float)
+        y = 0.5 * x ** 0.6
+        self.estimator.fit_nls(x, y)
+        self.estimator.impact_model = lambda x, eta, beta: eta * x**beta + 0.0
+        self.estimator.fit_nls(x, y)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_fit_groups_unseeded_bootstraps_not_cached(self):
+        # Test if an unseeded grouped fit only caches the (deterministic) group fits
+        self._set_synthetic_features()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.estimator.cache = ResultCache(cache_dir)
+        self.estimator.fit_groups(self.estimator.volume_groups(2), n_iter=5, max_workers=1)
+        self.assertEqual(sorted(name.split("-")[0] for name in os.listdir(cache_dir)), ["fit_nls", "fit_nls"])
+
+    def test_fit_groups_independent_group_seeds(self):
+        # Test if unseeded groups in the process pool get different resamples, and if seeded
+        # groups keep their estimates when other groups are added
+        self._set_synthetic_features()
+        rng = np.random.default_rng(1)
+        noise = pd.DataFrame(rng.normal(0, 0.01, (4, 8)), index=self.estimator.features["imbalance"].index,
+                             columns=self.estimator.features["imbalance"].columns)
+        self.estimator.features["terminal_price"] = self.estimator.features["terminal_price"] + noise
+        same_data = {'a': ['AAPL', 'GOOG'], 'b': ['AAPL', 'GOOG']}
+        unseeded = self.estimator.fit_groups(same_data, n_iter=5, max_workers=2)
+        self.assertNotEqual(unseeded["eta_se_pairs"][0], unseeded["eta_se_pairs"][1])
+        alone = self.estimator.fit_groups({'a': ['AAPL', 'GOOG']}, n_iter=5, max_workers=1, seed=0)
+        together = self.estimator.fit_groups({'z': ['IBM'], 'a': ['AAPL', 'GOOG']}, n_iter=5, max_workers=1, seed=0)
+        self.assertEqual(alone["eta_se_pairs"][0], together["eta_se_pairs"][1])
+
+    def test_heteroskedasticity_reuses_given_fit(self):
+        # Test if passing eta and beta skips the refit, and if the White test's code is in the cache key
+        x = np.array([1, 2, 3, 4, 5, 6, 7, 8], dtype=float)
+        y = 0.5 * x ** 0.6 + np.array([0.01, -0.02, 0.015, -0.01, 0.02, -0.015, 0.01, -0.01])
+        eta, beta = self.estimator.fit_nls(x, y)
+        with patch("taq.NLSEstimator.curve_fit", side_effect=AssertionError("refitted")):
+            uncached = self.estimator.test_heteroskedasticity(x, y, eta, beta)
+        self.assertEqual(len(uncached), 4)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.estimator.cache = ResultCache(cache_dir)
+        self.estimator.test_heteroskedasticity(x, y, eta, beta)
+        self.estimator._white_test = lambda x, y, eta, beta: np.zeros(4)
+        np.testing.assert_array_equal(self.estimator.test_heteroskedasticity(x, y, eta, beta), np.zeros(4))
+
 if __name__ == "__main__":
     unittest.main()
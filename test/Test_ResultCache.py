@@ -0,0 +1,69 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from taq.ResultCache import ResultCache
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        # Use a fresh temporary directory for every test
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_make_key(self):
+        # Test if keys depend on the array contents and on the settings
+        x = np.array([1.0, 2.0, 3.0])
+        key = self.cache.make_key("fit_nls", x, seed=1)
+        self.assertEqual(key, self.cache.make_key("fit_nls", x.copy(), seed=1))
+        self.assertNotEqual(key, self.cache.make_key("fit_nls", x + 1, seed=1))
+        self.assertNotEqual(key, self.cache.make_key("fit_nls", x, seed=2))
+        self.assertTrue(key.startswith("fit_nls-"))
+
+    def test_get_or_compute(self):
+        # Test if a stored result is returned without recomputing it
+        calls = []
+        compute = lambda: calls.append(1) or np.array([0.5, 0.6])
+        first = self.cache.get_or_compute("fit_nls-abc", compute)
+        second = self.cache.get_or_compute("fit_nls-abc", compute)
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_disabled(self):
+        # Test if a disabled cache neither stores nor returns results
+        cache = ResultCache(self.cache_dir, enabled=False)
+        cache.put("fit_nls-abc", np.array([1.0]))
+        self.assertIsNone(cache.get("fit_nls-abc"))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_invalidate(self):
+        # Test if invalidation removes all entries or only those of one kind
+        self.cache.put("fit_nls-a", np.array([1.0]))
+        self.cache.put("bootstrap_estimates-b", np.array([2.0]))
+        self.assertEqual(self.cache.invalidate("fit_nls"), 1)
+        self.assertIsNone(self.cache.get("fit_nls-a"))
+        self.assertIsNotNone(self.cache.get("bootstrap_estimates-b"))
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertIsNone(self.cache.get("bootstrap_estimates-b"))
+
+    def test_lru_eviction(self):
+        # Test if the least recently used entry is evicted once the size bound is exceeded
+        self.cache.put("a", np.zeros(100))
+        entry_size = os.path.getsize(os.path.join(self.cache_dir, "a.npy"))
+        self.cache.max_bytes = 2 * entry_size
+        self.cache.put("b", np.zeros(100))
+        past = time.time() - 10
+        os.utime(os.path.join(self.cache_dir, "a.npy"), (past, past))
+        os.utime(os.path.join(self.cache_dir, "b.npy"), (past + 1, past + 1))
+        self.cache.get("a")  # "a" becomes the most recently used entry
+        self.cache.put("c", np.zeros(100))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+if __name__ == "__main__":
+    unittest.main()